@@ -0,0 +1,77 @@
+"""
+Scaling benchmark for Climate TRACE page decoding (JSON decode + emissions mapping + merge).
+Uses synthetic 5000-asset pages shaped like the /v6/assets response; no network access needed.
+
+Usage:
+    python bench_trace_parse.py                 # 200k assets, 1/2/4/8 workers
+    python bench_trace_parse.py --points 1000000 --workers 1 2 4 8 16
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence
+from climate_trace import PAGE_SIZE, decode_trace_page, _columns_to_threats
+
+
+SECTORS = ["power", "cement", "steel", "oil-and-gas-production", "road-transportation", "coal-mining"]
+
+
+def synthetic_pages(points: int, seed: int = 42) -> List[bytes]:
+    rng = random.Random(seed)
+    pages = []
+    for offset in range(0, points, PAGE_SIZE):
+        assets = []
+        for i in range(offset, min(points, offset + PAGE_SIZE)):
+            q = rng.lognormvariate(11, 2.5)
+            assets.append({
+                "Id": i,
+                "Name": f"Synthetic asset {i}",
+                "Sector": rng.choice(SECTORS),
+                "Centroid": {"Geometry": [rng.uniform(-180, 180), rng.uniform(-60, 75)], "SRID": 4326},
+                "EmissionsSummary": [
+                    {"Gas": "co2e_100yr", "EmissionsQuantity": q},
+                    {"Gas": "co2e_20yr", "EmissionsQuantity": q * 1.3},
+                    {"Gas": "ch4", "EmissionsQuantity": q * 0.01},
+                ],
+            })
+        pages.append(json.dumps({"assets": assets}).encode("utf-8"))
+    return pages
+
+
+def run(pages: Sequence[bytes], workers: int) -> float:
+    t0 = time.perf_counter()
+    if workers == 1:
+        chunks = [decode_trace_page(raw) for raw in pages]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Warm the pool so process start-up is not counted
+            list(pool.map(abs, range(workers)))
+            t0 = time.perf_counter()
+            chunks = list(pool.map(decode_trace_page, pages))
+    threats = []
+    for cols in chunks:
+        threats.extend(_columns_to_threats(cols, len(cols["lat"])))
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--points", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.points)
+    print(f"{args.points:,} assets in {len(pages)} pages, {os.cpu_count()} CPUs available")
+    baseline = None
+    for w in args.workers:
+        elapsed = run(pages, w)
+        baseline = baseline or elapsed
+        print(f"workers={w:<3} {elapsed:6.2f}s  {args.points / elapsed:>10,.0f} assets/s  speedup x{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
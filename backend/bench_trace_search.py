@@ -0,0 +1,137 @@
+"""
+Correctness and latency check for trace_search.TraceSearchIndex on a synthetic corpus.
+Compares results with a brute-force scan on a small corpus, then times typical, broad, rare-intersection
+and empty queries on a large one. Exits non-zero if a result is wrong or a median exceeds the target.
+
+Usage:
+    python bench_trace_search.py                    # 1M assets, 5 ms target
+    python bench_trace_search.py --points 200000 --target-ms 5
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from typing import List, Sequence
+from models import ThreatData, ThreatCategory, Intensity
+from trace_search import MATERIALIZE_MAX, SCAN_MAX, SCAN_TIME_BUDGET_SEC, TraceSearchIndex, tokenize
+
+
+SECTORS = ["power", "cement", "steel", "oil-and-gas-production", "road-transportation", "coal-mining",
+           "petrochemicals", "pulp-and-paper", "solid-waste-disposal"]
+WORDS = ["power", "plant", "station", "unit", "thermal", "coal", "gas", "field", "mine", "refinery", "steel",
+         "works", "cement", "energy", "usina", "termica", "central", "huaneng", "datang", "guodian", "shenhua",
+         "north", "south", "river", "port", "bay", "lake", "valley", "hill", "new"]
+RARE = ["belchatow", "kori", "taichung", "kusile", "medupi", "niederaussem", "jaenschwalde", "eraring"]
+
+QUERIES = [
+    "belchatow",                                # rare single term
+    "taichung coal",                            # rare + broad
+    "usina termica",                            # two broad terms
+    "1 2",                                      # broad numeric prefixes
+    "p 1 2",                                    # very broad prefixes
+    "belchatow usina termica datang huaneng",   # rare, empty intersection
+    "kusile medupi",                            # two rare terms, empty intersection
+    "s 99999",                                  # broad + rare, empty
+    "19 power",                                 # mid-frequency + broad
+    "valley 4",                                 # broad + broad, sparse
+    "zzzzqq",                                   # no such token
+    "",                                         # empty query
+]
+
+
+def synthetic_threats(points: int, seed: int = 7) -> List[ThreatData]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(points):
+        words = [WORDS[min(int(rng.paretovariate(0.8)) - 1, len(WORDS) - 1)] for _ in range(rng.randint(1, 3))]
+        if rng.random() < 0.002:
+            words.insert(0, rng.choice(RARE))
+        label = " ".join(words).title() + f" {rng.randint(1, 99999)}"
+        out.append(ThreatData.model_construct(
+            lat=rng.uniform(-60, 75), lng=rng.uniform(-180, 180), value=rng.lognormvariate(11, 2.5),
+            category=ThreatCategory.EMISSIONS, intensity=Intensity.LOW, label=label, description="",
+            sector=rng.choice(SECTORS),
+        ))
+    return out
+
+
+def brute_force(threats: Sequence[ThreatData], query: str, limit: int) -> List[int]:
+    """Ids of the expected results, found by checking every asset."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+    out = []
+    for i in sorted(range(len(threats)), key=lambda i: -threats[i].value):
+        toks = tokenize(threats[i].label) + tokenize(threats[i].sector)
+        if all(any(tok.startswith(term) for tok in toks) for term in terms):
+            out.append(id(threats[i]))
+            if len(out) == limit:
+                break
+    return out
+
+
+def check_correctness(points: int, limit: int) -> bool:
+    threats = synthetic_threats(points, seed=11)
+    index = TraceSearchIndex()
+    for i in range(0, len(threats), 5000):
+        index.add(threats[i:i + 5000])
+    ok = True
+    for within in (None, points // 3):
+        eligible = threats if within is None else threats[:within]
+        for query in QUERIES + ["unit 12", "ce", "north river", "kori 1"]:
+            found, truncated = index.search(query, limit=limit, within=within)
+            got = [id(t) for t in found]
+            expected = brute_force(eligible, query, limit)
+            # A truncated scan still returns the top matches, just possibly fewer than exist
+            if got != expected[:len(got)] or (not truncated and len(got) != len(expected)):
+                print(f"MISMATCH for {query!r} (within={within}, truncated={truncated})")
+                ok = False
+    print(f"correctness on {points:,} assets: {'ok' if ok else 'FAILED'}")
+    return ok
+
+
+def time_queries(points: int, limit: int, reps: int, target_ms: float) -> bool:
+    t0 = time.perf_counter()
+    index = TraceSearchIndex()
+    threats = synthetic_threats(points)
+    for i in range(0, len(threats), 5000):
+        index.add(threats[i:i + 5000])
+    index.search("warm up")  # sorts vocab/value order, as the first search after a crawl would
+    index.search("p 1")
+    print(f"indexed {points:,} assets in {time.perf_counter() - t0:.1f}s "
+          f"(MATERIALIZE_MAX={MATERIALIZE_MAX:,}, SCAN_MAX={SCAN_MAX:,}, "
+          f"SCAN_TIME_BUDGET_SEC={SCAN_TIME_BUDGET_SEC})")
+
+    ok = True
+    for query in QUERIES:
+        samples = []
+        for _ in range(reps):
+            t = time.perf_counter()
+            found, truncated = index.search(query, limit=limit)
+            samples.append((time.perf_counter() - t) * 1000)
+        median = statistics.median(samples)
+        flag = "" if median < target_ms else "  <-- over target"
+        ok = ok and median < target_ms
+        note = " (truncated)" if truncated else ""
+        print(f"{query!r:45} {len(found):3} hits{note:12} p50 {median:6.2f} ms  max {max(samples):6.2f} ms{flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--points", type=int, default=1_000_000)
+    parser.add_argument("--check-points", type=int, default=60_000, help="corpus size for the brute-force check")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--reps", type=int, default=20)
+    parser.add_argument("--target-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    ok = check_correctness(args.check_points, args.limit)
+    ok = time_queries(args.points, args.limit, args.reps, args.target_ms) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,21 @@ Fetches millions of emissions sources from https://api.climatetrace.org
 Data: CC BY 4.0, https://climatetrace.org/data
 """
 
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
 import time
-from typing import List, Any, Optional
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Any, Optional, Tuple
 import httpx
 from models import ThreatData, ThreatCategory, Intensity, ClimateStats
+from trace_query import TraceColumns
+from trace_search import TraceSearchIndex
+from trace_decimate import decimate_threats
 
 
 TRACE_API_BASE = "https://api.climatetrace.org/v6"
@@ -15,9 +26,25 @@ TRACE_API_BASE = "https://api.climatetrace.org/v6"
 DEFAULT_MAX_POINTS = 16_500
 PAGE_SIZE = 5000
 CACHE_TTL_SEC = 3600  # 1 hour
+# Decode/map pages in worker processes when fetching at least this many points
+PARALLEL_MIN_POINTS = int(os.getenv("TRACE_PARALLEL_MIN_POINTS", "50000"))
+# Worker processes for page decoding per server process (0 = CPU count shared across the
+# WEB_CONCURRENCY server workers, 1 = always decode in-process)
+TRACE_WORKERS = int(os.getenv("TRACE_WORKERS", "0")) or max(
+    1, (os.cpu_count() or 1) // max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+)
+# Derived views of the cached crawl (shorter prefixes, decimated samples, their column views), LRU
+VIEW_MEMO_MAX = 8
 
 
 _cache: Optional[dict] = None
+# Search index for the most recent crawl; filled page by page so it is usable while the crawl runs
+_search_index: Optional[dict] = None
+_pool: Optional[ProcessPoolExecutor] = None
+# Handlers call into the cache from several threadpool threads: _crawl_lock makes crawls single-flight
+# (a request waits for a running crawl instead of starting its own), _views_lock guards each entry's views
+_crawl_lock = threading.Lock()
+_views_lock = threading.Lock()
 
 
 def _parse_emissions_quantity(asset: dict, gwp_years: int = 100) -> float:
@@ -36,8 +63,28 @@ def _parse_emissions_quantity(asset: dict, gwp_years: int = 100) -> float:
     return 0.0
 
 
-def _asset_to_threat(asset: dict, gwp_years: int = 100) -> ThreatData:
-    """Map Climate TRACE asset to our ThreatData (emissions threat)."""
+def _intensity_for(value_gt: float) -> Intensity:
+    return Intensity.HIGH if value_gt >= 1 else (Intensity.MEDIUM if value_gt >= 0.01 else Intensity.LOW)
+
+
+def _value_tonnes(value_gt: float) -> float:
+    """Tonnes CO2e for a display value from _asset_fields (Mt; no single asset reaches the 1 Gt switch)."""
+    return value_gt * 1e6
+
+
+def _decimate(threats: List[ThreatData], budget: int, gwp_years: int) -> List[ThreatData]:
+    """decimate_threats with intensity and description recomputed for sources that absorbed neighbours."""
+
+    def describe(t: ThreatData, value_gt: float, absorbed: int) -> str:
+        sector = (t.sector or "other").replace("-", " ")
+        nearby = f"{absorbed} nearby source{'s' if absorbed != 1 else ''}"
+        return f"{sector} • {_value_tonnes(value_gt):,.0f} t CO2e {gwp_years}yr incl. {nearby}"
+
+    return decimate_threats(threats, budget, _intensity_for, describe)
+
+
+def _asset_fields(asset: dict, gwp_years: int = 100) -> tuple:
+    """Map a Climate TRACE asset to (lat, lng, value, intensity, label, description, sector)."""
     geom = (asset.get("Centroid") or {}).get("Geometry") or [0, 0]
     lng, lat = float(geom[0]), float(geom[1])
     value = _parse_emissions_quantity(asset, gwp_years)
@@ -45,23 +92,117 @@ def _asset_to_threat(asset: dict, gwp_years: int = 100) -> ThreatData:
     value_gt = value / 1e9 if value >= 1e9 else value / 1e6  # Gt or Mt
     sector = (asset.get("Sector") or "other").replace("-", " ")
     name = (asset.get("Name") or "Asset").strip() or f"Source ({sector})"
-    intensity = Intensity.HIGH if value_gt >= 1 else (Intensity.MEDIUM if value_gt >= 0.01 else Intensity.LOW)
+    intensity = _intensity_for(value_gt)
     gwp_label = f"{gwp_years}yr"
+    return (
+        lat,
+        lng,
+        value_gt,
+        intensity,
+        name[:200],
+        f"{sector} • {value:,.0f} t CO2e {gwp_label}",
+        asset.get("Sector") or "other",
+    )
+
+
+def _asset_to_threat(asset: dict, gwp_years: int = 100) -> ThreatData:
+    """Map Climate TRACE asset to our ThreatData (emissions threat)."""
+    lat, lng, value, intensity, label, description, sector = _asset_fields(asset, gwp_years)
     return ThreatData(
         lat=lat,
         lng=lng,
-        value=value_gt,
+        value=value,
         type="threat",
         category=ThreatCategory.EMISSIONS,
         intensity=intensity,
-        label=name[:200],
-        description=f"{sector} • {value:,.0f} t CO2e {gwp_label}",
-        sector=asset.get("Sector") or "other",
+        label=label,
+        description=description,
+        sector=sector,
     )
 
 
-def fetch_trace_assets(limit: int = PAGE_SIZE, offset: int = 0, year: Optional[int] = None) -> dict:
-    """One page of assets from Climate TRACE API. year: optional filter (e.g. 2021-2024); may be ignored by API."""
+def decode_trace_page(raw: bytes, gwp_years: int = 100) -> dict:
+    """
+    JSON-decode one raw API page and map it to column chunks (runs in worker processes).
+    Columns are flat arrays/lists so the result pickles as a handful of objects, not one per asset.
+    """
+    assets = json.loads(raw).get("assets") or []
+    lat, lng, value = array("d"), array("d"), array("d")
+    intensity = bytearray()
+    labels: List[str] = []
+    descriptions: List[str] = []
+    sectors: List[str] = []
+    codes = {Intensity.HIGH: 0, Intensity.MEDIUM: 1, Intensity.LOW: 2}
+    for asset in assets:
+        try:
+            centroid = (asset.get("Centroid") or {}).get("Geometry")
+            if not centroid or len(centroid) < 2:
+                continue
+            f = _asset_fields(asset, gwp_years)
+        except Exception:
+            continue
+        lat.append(f[0])
+        lng.append(f[1])
+        value.append(f[2])
+        intensity.append(codes[f[3]])
+        labels.append(f[4])
+        descriptions.append(f[5])
+        sectors.append(f[6])
+    return {
+        "n_assets": len(assets),
+        "lat": lat,
+        "lng": lng,
+        "value": value,
+        "intensity": bytes(intensity),
+        "label": labels,
+        "description": descriptions,
+        "sector": sectors,
+    }
+
+
+def _columns_to_threats(cols: dict, limit: int) -> List[ThreatData]:
+    """Build ThreatData from a decoded column chunk (fields were already validated by _asset_fields)."""
+    intensities = (Intensity.HIGH, Intensity.MEDIUM, Intensity.LOW)
+    n = min(limit, len(cols["lat"]))
+    return [
+        ThreatData.model_construct(
+            lat=cols["lat"][i],
+            lng=cols["lng"][i],
+            value=cols["value"][i],
+            type="threat",
+            category=ThreatCategory.EMISSIONS,
+            intensity=intensities[cols["intensity"][i]],
+            label=cols["label"][i],
+            description=cols["description"][i],
+            sector=cols["sector"][i],
+        )
+        for i in range(n)
+    ]
+
+
+def _new_pool() -> ProcessPoolExecutor:
+    # Never fork: the server process has live threads (executor, uvicorn) whose locks a forked child inherits
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=TRACE_WORKERS, mp_context=multiprocessing.get_context(method))
+
+
+def start_worker_pool() -> None:
+    """Start the shared page-decoding pool (called on app startup). No-op if TRACE_WORKERS is 1."""
+    global _pool
+    if _pool is None and TRACE_WORKERS > 1:
+        _pool = _new_pool()
+
+
+def shutdown_worker_pool() -> None:
+    """Stop the shared pool (called on app shutdown), cancelling decodes that have not started."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def fetch_trace_page(limit: int = PAGE_SIZE, offset: int = 0, year: Optional[int] = None) -> bytes:
+    """Raw JSON body of one page of assets (decoded later, possibly in a worker process)."""
     params: dict = {"limit": limit, "offset": offset}
     if year is not None:
         params["year"] = year
@@ -69,16 +210,21 @@ def fetch_trace_assets(limit: int = PAGE_SIZE, offset: int = 0, year: Optional[i
         try:
             r = client.get(f"{TRACE_API_BASE}/assets", params=params)
             r.raise_for_status()
-            return r.json()
+            return r.content
         except Exception:
             if year is not None:
                 params.pop("year", None)
                 r = client.get(f"{TRACE_API_BASE}/assets", params=params)
                 r.raise_for_status()
-                return r.json()
+                return r.content
             raise
 
 
+def fetch_trace_assets(limit: int = PAGE_SIZE, offset: int = 0, year: Optional[int] = None) -> dict:
+    """One page of assets from Climate TRACE API. year: optional filter (e.g. 2021-2024); may be ignored by API."""
+    return json.loads(fetch_trace_page(limit=limit, offset=offset, year=year))
+
+
 def stream_trace_chunks(
     max_points: int = 16_500,
     chunk_size: int = PAGE_SIZE,
@@ -112,26 +258,8 @@ def stream_trace_chunks(
             break
 
 
-def get_trace_threats(
-    max_points: int = DEFAULT_MAX_POINTS,
-    year: Optional[int] = None,
-    gwp_years: int = 100,
-) -> List[ThreatData]:
-    """
-    Fetch up to max_points emissions sources from Climate TRACE and return as ThreatData.
-    year: optional (e.g. 2021-2024). gwp_years: 20 or 100 for CO2e 20yr/100yr GWP.
-    Uses in-memory cache for CACHE_TTL_SEC to avoid hammering the API.
-    """
-    global _cache
-    cache_key = (max_points, year, gwp_years)
-    now = time.time()
-    if (
-        _cache is not None
-        and (now - _cache["ts"]) < CACHE_TTL_SEC
-        and _cache.get("cache_key") == cache_key
-    ):
-        return _cache["threats"][:max_points]
-
+def _crawl_serial(max_points: int, year: Optional[int], gwp_years: int, index: TraceSearchIndex) -> List[ThreatData]:
+    """Fetch and map pages one at a time in this process."""
     threats: List[ThreatData] = []
     offset = 0
     while len(threats) < max_points:
@@ -140,6 +268,7 @@ def get_trace_threats(
             assets = data.get("assets") or []
             if not assets:
                 break
+            page_start = len(threats)
             for asset in assets:
                 try:
                     centroid = (asset.get("Centroid") or {}).get("Geometry")
@@ -151,17 +280,207 @@ def get_trace_threats(
                         break
                 except Exception:
                     continue
+            index.add(threats[page_start:])
             if len(assets) < PAGE_SIZE:
                 break
             offset += PAGE_SIZE
             time.sleep(0.2)  # be nice to the API
         except Exception:
             break
+    return threats
+
+
+def _crawl_parallel(max_points: int, year: Optional[int], gwp_years: int, index: TraceSearchIndex) -> List[ThreatData]:
+    """
+    Fetch pages here while worker processes decode and map earlier pages.
+    Pages are merged in offset order (in this process); fetching stops early once a short page is decoded.
+    Uses the app's shared pool, or a pool for this crawl only when called outside the app (e.g. export_tiles).
+    """
+    if _pool is None:
+        with _new_pool() as pool:
+            return _crawl_with_pool(pool, max_points, year, gwp_years, index)
+    return _crawl_with_pool(_pool, max_points, year, gwp_years, index)
+
+
+def _crawl_with_pool(
+    pool: ProcessPoolExecutor, max_points: int, year: Optional[int], gwp_years: int, index: TraceSearchIndex
+) -> List[ThreatData]:
+    pending: deque = deque()
+    threats: List[ThreatData] = []
+    offset = 0
+    exhausted = False
+    while len(threats) < max_points:
+        # Pages in flight can yield at most PAGE_SIZE points each (fewer if assets are skipped), so keep
+        # fetching until they could cover max_points; stopping at the offset would return short when assets are dropped
+        while not exhausted and len(threats) + PAGE_SIZE * len(pending) < max_points and len(pending) < TRACE_WORKERS:
+            try:
+                raw = fetch_trace_page(limit=PAGE_SIZE, offset=offset, year=year)
+            except Exception:
+                exhausted = True
+                break
+            pending.append(pool.submit(decode_trace_page, raw, gwp_years))
+            offset += PAGE_SIZE
+            time.sleep(0.2)  # be nice to the API
+        if not pending:
+            break
+        try:
+            cols = pending.popleft().result()
+        except Exception:
+            break
+        page = _columns_to_threats(cols, max_points - len(threats))
+        threats.extend(page)
+        index.add(page)
+        if cols["n_assets"] < PAGE_SIZE:
+            break
+    for future in pending:
+        future.cancel()
+    return threats
+
+
+def _covering_entry(max_points: int, year: Optional[int], gwp_years: int) -> Optional[dict]:
+    """
+    The cache entry if it is fresh and holds the first max_points sources for (year, gwp_years).
+    A crawl of N sources also serves every smaller max_points (the API order is the same), so alternating
+    between small and large requests does not evict and re-crawl.
+    """
+    entry = _cache
+    if entry is None or time.time() - entry["ts"] >= CACHE_TTL_SEC:
+        return None
+    cached_points, cached_year, cached_gwp = entry["cache_key"]
+    if (cached_year, cached_gwp) != (year, gwp_years) or cached_points < max_points:
+        return None
+    return entry
+
+
+def _entry_view(entry: dict, key: tuple, compute):
+    """
+    Memoize a view derived from a cache entry; at most VIEW_MEMO_MAX views are kept per entry.
+    compute() runs outside the lock, so a slow view (e.g. decimation) does not hold up other requests.
+    """
+    views: OrderedDict = entry["views"]
+    with _views_lock:
+        if key in views:
+            views.move_to_end(key)
+            return views[key]
+    value = compute()
+    with _views_lock:
+        value = views.setdefault(key, value)  # keep the first result if another thread computed it too
+        views.move_to_end(key)
+        if len(views) > VIEW_MEMO_MAX:
+            views.popitem(last=False)
+    return value
+
+
+def _entry_threats(entry: dict, max_points: int, decimate_from: Optional[int]) -> List[ThreatData]:
+    """The cached crawl's first max_points sources, or its decimated sample of the first decimate_from."""
+    if decimate_from is None:
+        return entry["threats"][:max_points]
+    return _entry_view(
+        entry,
+        ("decimated", decimate_from, max_points),
+        lambda: _decimate(entry["threats"][:decimate_from], max_points, entry["cache_key"][2]),
+    )
+
+
+def get_trace_threats(
+    max_points: int = DEFAULT_MAX_POINTS,
+    year: Optional[int] = None,
+    gwp_years: int = 100,
+    decimate_from: Optional[int] = None,
+) -> List[ThreatData]:
+    """
+    Fetch up to max_points emissions sources from Climate TRACE and return as ThreatData.
+    year: optional (e.g. 2021-2024). gwp_years: 20 or 100 for CO2e 20yr/100yr GWP.
+    decimate_from: if larger than max_points, fetch that many sources and return a spatially balanced,
+    value-preserving sample of max_points (see trace_decimate) instead of the first max_points.
+    Uses in-memory cache for CACHE_TTL_SEC to avoid hammering the API.
+    """
+    global _cache, _search_index
+    if decimate_from is not None and decimate_from > max_points:
+        source = get_trace_threats(max_points=decimate_from, year=year, gwp_years=gwp_years)
+        entry = _covering_entry(decimate_from, year, gwp_years)
+        if entry is None:
+            # Cache was replaced concurrently; sample what we fetched without memoizing
+            return _decimate(source, max_points, gwp_years)
+        return _entry_threats(entry, max_points, decimate_from)[:]
+
+    entry = _covering_entry(max_points, year, gwp_years)
+    if entry is not None:
+        return _entry_threats(entry, max_points, None)
 
-    _cache = {"threats": threats, "ts": now, "cache_key": cache_key}
+    with _crawl_lock:
+        # Another request may have crawled what we need while we waited
+        entry = _covering_entry(max_points, year, gwp_years)
+        if entry is not None:
+            return _entry_threats(entry, max_points, None)
+        cache_key = (max_points, year, gwp_years)
+        now = time.time()
+        index = TraceSearchIndex()
+        _search_index = {"cache_key": cache_key, "ts": now, "index": index}
+        if max_points >= PARALLEL_MIN_POINTS and TRACE_WORKERS > 1:
+            threats = _crawl_parallel(max_points, year, gwp_years, index)
+        else:
+            threats = _crawl_serial(max_points, year, gwp_years, index)
+        _cache = {"threats": threats, "ts": now, "cache_key": cache_key, "views": OrderedDict()}
     return threats
 
 
+def get_trace_columns(
+    max_points: int = DEFAULT_MAX_POINTS,
+    year: Optional[int] = None,
+    gwp_years: int = 100,
+    decimate_from: Optional[int] = None,
+) -> TraceColumns:
+    """
+    Column view of the cached trace snapshot for server-side filtering (see trace_query).
+    Built once per cache fill and view, and reused, so filter memoization survives across requests.
+    """
+    threats = get_trace_threats(max_points=max_points, year=year, gwp_years=gwp_years, decimate_from=decimate_from)
+    if decimate_from is not None and decimate_from <= max_points:
+        decimate_from = None
+    entry = _covering_entry(decimate_from or max_points, year, gwp_years)
+    if entry is None:
+        # Cache was replaced concurrently; serve an unshared view of what we fetched
+        return TraceColumns(threats, snapshot_id=f"{time.time():.6f}")
+    key = ("columns", max_points, decimate_from)
+
+    def build() -> TraceColumns:
+        snapshot_id = hashlib.sha1(repr((entry["cache_key"], entry["ts"], key)).encode("utf-8")).hexdigest()[:12]
+        return TraceColumns(_entry_threats(entry, max_points, decimate_from), snapshot_id)
+
+    return _entry_view(entry, key, build)
+
+
+def search_trace_threats(
+    q: str,
+    limit: int = 20,
+    max_points: int = DEFAULT_MAX_POINTS,
+    year: Optional[int] = None,
+    gwp_years: int = 100,
+) -> Tuple[List[ThreatData], bool]:
+    """
+    Search cached trace points by label/sector prefix, highest emissions first.
+    Returns (results, truncated); truncated means a broad query's time-bounded scan may have missed matches.
+    Uses the index of the current crawl if it is fresh and covers (max_points, year, gwp_years), fetching first if not.
+    """
+
+    def covering_index() -> Optional[TraceSearchIndex]:
+        if _search_index is None or time.time() - _search_index["ts"] >= CACHE_TTL_SEC:
+            return None
+        cached_points, cached_year, cached_gwp = _search_index["cache_key"]
+        if (cached_year, cached_gwp) != (year, gwp_years) or cached_points < max_points:
+            return None
+        return _search_index["index"]
+
+    index = covering_index()
+    if index is None:
+        get_trace_threats(max_points=max_points, year=year, gwp_years=gwp_years)
+        index = covering_index()
+    if index is None:
+        return [], False
+    return index.search(q, limit=limit, within=max_points)
+
+
 def get_climate_stats_placeholder() -> ClimateStats:
     """Stats when using Climate TRACE (we don't have global stats from API here)."""
     return ClimateStats(
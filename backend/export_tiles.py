@@ -0,0 +1,286 @@
+"""
+Export Climate TRACE emissions as a static pyramid of pre-aggregated tiles for CDN / static hosting.
+
+Layout (default out dir ../public/tiles, which `next build` copies into the static site):
+    index.json                                  years, GWP horizons and manifest paths
+    {year}/{gwp}/manifest.json                  zoom levels and tiles per zoom (with bin/source counts)
+    {year}/{gwp}/{z}/{x}/{y}.json.gz            bins for one tile (gzipped JSON)
+
+Tile (z, x, y) covers 180/2^z degrees square: x counts columns east from -180° lng (2^(z+1) columns),
+y counts rows south from +90° lat (2^z rows). Each tile holds up to BINS x BINS bins of
+[lat, lng, value, count, label, sector]: value-weighted centroid, summed value, source count, and the
+label/sector of the largest source in the bin.
+
+Usage:
+    python export_tiles.py --years 2023 2024 --gwp 100 20 --max-points 100000
+    python export_tiles.py --input trace.ndjson --years 2024 --gwp 100   # from /api/climate/trace/stream output
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+from models import ThreatData
+from climate_trace import get_trace_threats
+
+
+DEFAULT_OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "public", "tiles")
+DEFAULT_MAX_ZOOM = 5
+BINS = 32  # bins per tile side
+TILE_VERSION = 1
+
+# Columns shared with worker processes (set once per worker by _init_worker)
+_columns: Optional[dict] = None
+
+
+def load_threats_file(path: str) -> List[ThreatData]:
+    """Read ThreatData from NDJSON (stream endpoint output) or a JSON response/array."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+        rows = data.get("threats", []) if isinstance(data, dict) else data
+    except json.JSONDecodeError:
+        rows = []
+        for line in text.splitlines():
+            if line.strip():
+                rows.extend(json.loads(line))
+    return [ThreatData(**r) for r in rows]
+
+
+def to_columns(threats: Sequence[ThreatData]) -> dict:
+    """Flatten threats to compact columns so workers receive them once instead of per-object pickles."""
+    return {
+        "lat": array("d", (t.lat for t in threats)),
+        "lng": array("d", (t.lng for t in threats)),
+        "value": array("d", (t.value for t in threats)),
+        "label": [t.label for t in threats],
+        "sector": [t.sector or "other" for t in threats],
+    }
+
+
+def tile_span(z: int) -> float:
+    return 180.0 / (1 << z)
+
+
+def tile_of(lat: float, lng: float, z: int) -> Tuple[int, int]:
+    span = tile_span(z)
+    x = min(int((lng + 180.0) / span), (2 << z) - 1)
+    y = min(int((90.0 - lat) / span), (1 << z) - 1)
+    return max(x, 0), max(y, 0)
+
+
+def group_by_tile(columns: dict, max_zoom: int) -> Dict[Tuple[int, int, int], array]:
+    """Point indices per tile for every zoom level 0..max_zoom (children roll up into parents)."""
+    groups: Dict[Tuple[int, int, int], array] = {}
+    lats, lngs = columns["lat"], columns["lng"]
+    for i in range(len(lats)):
+        x, y = tile_of(lats[i], lngs[i], max_zoom)
+        key = (max_zoom, x, y)
+        bucket = groups.get(key)
+        if bucket is None:
+            bucket = groups[key] = array("I")
+        bucket.append(i)
+    for z in range(max_zoom - 1, -1, -1):
+        for (cz, cx, cy), idx in list(groups.items()):
+            if cz != z + 1:
+                continue
+            key = (z, cx >> 1, cy >> 1)
+            parent = groups.get(key)
+            if parent is None:
+                groups[key] = array("I", idx)
+            else:
+                parent.extend(idx)
+    return groups
+
+
+def _init_worker(columns: dict) -> None:
+    global _columns
+    _columns = columns
+
+
+def aggregate_tile(z: int, x: int, y: int, indices: Sequence[int], columns: Optional[dict] = None) -> List[list]:
+    """Bin the given points of tile (z, x, y) into at most BINS x BINS aggregated bins, largest first."""
+    cols = columns if columns is not None else _columns
+    lats, lngs, values = cols["lat"], cols["lng"], cols["value"]
+    span = tile_span(z)
+    west, north = x * span - 180.0, 90.0 - y * span
+    scale = BINS / span
+    bins: Dict[int, list] = {}
+    for i in indices:
+        lat, lng, v = lats[i], lngs[i], values[i]
+        bx = min(int((lng - west) * scale), BINS - 1)
+        by = min(int((north - lat) * scale), BINS - 1)
+        b = bins.get(by * BINS + bx)
+        w = v if v > 0 else 0.0
+        if b is None:
+            # [sum lat*w, sum lng*w, sum w, count, top index, sum lat, sum lng]
+            bins[by * BINS + bx] = [lat * w, lng * w, w, 1, i, lat, lng]
+        else:
+            b[0] += lat * w
+            b[1] += lng * w
+            b[2] += w
+            b[3] += 1
+            b[5] += lat
+            b[6] += lng
+            if v > values[b[4]]:
+                b[4] = i
+    out = []
+    for wlat, wlng, w, n, top, slat, slng in bins.values():
+        lat, lng = (wlat / w, wlng / w) if w > 0 else (slat / n, slng / n)
+        out.append([round(lat, 4), round(lng, 4), round(w, 6), n, cols["label"][top], cols["sector"][top]])
+    out.sort(key=lambda b: -b[2])
+    return out
+
+
+def _write_tiles(out_dir: str, tasks: List[Tuple[int, int, int, array]]) -> List[Tuple[int, int, int, int, int]]:
+    """Aggregate and write a batch of tiles; returns (z, x, y, bins, sources) per tile."""
+    written = []
+    for z, x, y, indices in tasks:
+        bins = aggregate_tile(z, x, y, indices)
+        tile_dir = os.path.join(out_dir, str(z), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        payload = json.dumps({"z": z, "x": x, "y": y, "bins": bins}, separators=(",", ":"), ensure_ascii=False)
+        with gzip.open(os.path.join(tile_dir, f"{y}.json.gz"), "wb", compresslevel=6) as f:
+            f.write(payload.encode("utf-8"))
+        written.append((z, x, y, len(bins), len(indices)))
+    return written
+
+
+def export_pyramid(
+    threats: Sequence[ThreatData],
+    out_dir: str,
+    max_zoom: int = DEFAULT_MAX_ZOOM,
+    workers: Optional[int] = None,
+    batch_size: int = 64,
+) -> dict:
+    """
+    Write all tiles for one (year, gwp) dataset under out_dir and return its manifest.
+    Tiles are written to a sibling temp dir that then replaces out_dir, so tiles from an earlier export
+    (e.g. with a higher max_zoom or more sources) never linger next to the new manifest.
+    """
+    final_dir = os.path.normpath(out_dir)
+    tmp_dir = f"{final_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        manifest = _write_pyramid(threats, tmp_dir, max_zoom, workers, batch_size)
+        _swap_dir(tmp_dir, final_dir)
+    except BaseException:
+        # Never leave a partial export inside the static site (next build would ship it)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return manifest
+
+
+def _write_pyramid(
+    threats: Sequence[ThreatData], out_dir: str, max_zoom: int, workers: Optional[int], batch_size: int
+) -> dict:
+    columns = to_columns(threats)
+    groups = group_by_tile(columns, max_zoom)
+    # Largest tiles first so the pool is not left waiting on one big tile at the end
+    tasks = sorted(((z, x, y, idx) for (z, x, y), idx in groups.items()), key=lambda t: -len(t[3]))
+    batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+
+    written: List[Tuple[int, int, int, int, int]] = []
+    if workers == 1 or len(batches) <= 1:
+        _init_worker(columns)
+        for batch in batches:
+            written.extend(_write_tiles(out_dir, batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(columns,)) as pool:
+            for result in pool.map(_write_tiles, [out_dir] * len(batches), batches):
+                written.extend(result)
+
+    zooms = {}
+    for z, x, y, n_bins, n_sources in sorted(written):
+        zooms.setdefault(str(z), []).append([x, y, n_bins, n_sources])
+    manifest = {
+        "version": TILE_VERSION,
+        "max_zoom": max_zoom,
+        "bins_per_tile": BINS,
+        "tile_path": "{z}/{x}/{y}.json.gz",
+        "bin_fields": ["lat", "lng", "value", "count", "label", "sector"],
+        "total_sources": len(threats),
+        "total_value": round(sum(columns["value"]), 6),
+        "generated_at": int(time.time()),
+        "tiles": zooms,  # zoom -> [[x, y, bins, sources], ...]
+    }
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    return manifest
+
+
+def _swap_dir(new_dir: str, final_dir: str) -> None:
+    """
+    Replace final_dir with new_dir; the old tree is renamed aside first so final_dir is never half-written,
+    and put back if new_dir cannot be moved into place.
+    """
+    old_dir = f"{final_dir}.old-{os.getpid()}"
+    had_old = os.path.exists(final_dir)
+    if had_old:
+        os.rename(final_dir, old_dir)
+    try:
+        os.rename(new_dir, final_dir)
+    except BaseException:
+        if had_old:
+            os.rename(old_dir, final_dir)
+        raise
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export Climate TRACE emissions as static pre-aggregated tiles")
+    parser.add_argument("--out", default=DEFAULT_OUT_DIR, help="Output directory (default: ../public/tiles)")
+    parser.add_argument("--years", type=int, nargs="+", default=[2024], help="Emissions years to export")
+    parser.add_argument("--gwp", type=int, nargs="+", default=[100, 20], choices=[20, 100], help="GWP horizons")
+    parser.add_argument("--max-points", type=int, default=100_000, help="Sources to fetch per year/GWP")
+    parser.add_argument("--max-zoom", type=int, default=DEFAULT_MAX_ZOOM, help="Deepest zoom level (0-10)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--input", help="Export this NDJSON/JSON file instead of fetching (needs one year and GWP)")
+    args = parser.parse_args(argv)
+
+    if not 0 <= args.max_zoom <= 10:
+        parser.error("--max-zoom must be between 0 and 10")
+    if args.input and (len(args.years) != 1 or len(args.gwp) != 1):
+        parser.error("--input exports a single dataset; pass exactly one --years and one --gwp")
+
+    index_path = os.path.join(args.out, "index.json")
+    index = {"version": TILE_VERSION, "datasets": []}
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    for year in args.years:
+        for gwp in args.gwp:
+            t0 = time.time()
+            if args.input:
+                threats = load_threats_file(args.input)
+            else:
+                threats = get_trace_threats(max_points=args.max_points, year=year, gwp_years=gwp)
+            dataset_dir = os.path.join(args.out, str(year), str(gwp))
+            os.makedirs(os.path.dirname(dataset_dir), exist_ok=True)
+            manifest = export_pyramid(threats, dataset_dir, max_zoom=args.max_zoom, workers=args.workers)
+            n_tiles = sum(len(t) for t in manifest["tiles"].values())
+            print(f"{year} GWP{gwp}: {len(threats):,} sources -> {n_tiles:,} tiles in {time.time() - t0:.1f}s")
+            index["datasets"] = [
+                d for d in index["datasets"] if (d["year"], d["gwp_years"]) != (year, gwp)
+            ]
+            index["datasets"].append({
+                "year": year,
+                "gwp_years": gwp,
+                "manifest": f"{year}/{gwp}/manifest.json",
+                "total_sources": manifest["total_sources"],
+            })
+
+    index["datasets"].sort(key=lambda d: (d["year"], d["gwp_years"]))
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Local load test for the live trace WebSocket (/api/climate/trace/ws).
+Opens hundreds of simulated subscribers, checks they all share one upstream crawl per view,
+and reports time to first chunk / complete. Half the clients switch view mid-stream, and clients
+use distinct bboxes (as panning map clients would) so per-bbox message caching stays bounded.
+
+Usage:
+    python loadtest_ws.py                          # in-process server with a synthetic upstream
+    python loadtest_ws.py --clients 500 --points 20000
+    python loadtest_ws.py --bboxes 10            # clients share 10 bboxes instead of one each
+    python loadtest_ws.py --url ws://localhost:8000/api/climate/trace/ws   # against a running server
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+from typing import List, Optional
+import httpx
+import uvicorn
+import websockets
+
+
+def use_synthetic_upstream(total_assets: int) -> None:
+    """Replace the Climate TRACE fetch with deterministic synthetic pages (no network)."""
+    import climate_trace
+
+    def fetch(limit: int = climate_trace.PAGE_SIZE, offset: int = 0, year: Optional[int] = None) -> dict:
+        rng = random.Random(offset * 31 + (year or 0))
+        n = max(0, min(limit, total_assets - offset))
+        return {"assets": [{
+            "Name": f"Synthetic {offset + i}",
+            "Sector": rng.choice(["power", "cement", "steel"]),
+            "Centroid": {"Geometry": [rng.uniform(-180, 180), rng.uniform(-60, 75)]},
+            "EmissionsSummary": [{"Gas": "co2e_100yr", "EmissionsQuantity": rng.lognormvariate(11, 2)},
+                                 {"Gas": "co2e_20yr", "EmissionsQuantity": rng.lognormvariate(11, 2)}],
+        } for i in range(n)]}
+
+    climate_trace.fetch_trace_assets = fetch
+
+
+def start_server(port: int) -> None:
+    config = uvicorn.Config("main:app", host="127.0.0.1", port=port, log_level="warning", ws_max_size=64 * 2**20)
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.time() + 20
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("server did not start")
+        time.sleep(0.05)
+
+
+async def client(url: str, views: List[dict], switch: bool, results: list) -> None:
+    t0 = time.perf_counter()
+    first_chunk = complete = None
+    points = 0
+    async with websockets.connect(url, max_size=64 * 2**20, compression=None) as ws:
+        await ws.send(json.dumps({"action": "subscribe", **views[0]}))
+        switched = False
+        async for raw in ws:
+            msg = json.loads(raw)
+            if msg["type"] == "chunk":
+                first_chunk = first_chunk or time.perf_counter() - t0
+                points += len(msg["points"])
+                if switch and not switched:
+                    # Change view on the same connection after the first chunk
+                    switched = True
+                    points = 0
+                    await ws.send(json.dumps({"action": "subscribe", **views[1]}))
+            elif msg["type"] == "snapshot":
+                points = 0
+            elif msg["type"] == "complete" and (switched or not switch):
+                complete = time.perf_counter() - t0
+                break
+            elif msg["type"] == "error":
+                raise RuntimeError(msg["detail"])
+    results.append((first_chunk, complete, points))
+
+
+def pct(values: List[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def random_bbox(rng: random.Random) -> Optional[List[float]]:
+    """A map-viewport-sized [west, south, east, north], sometimes crossing the antimeridian; None = whole globe."""
+    if rng.random() < 0.1:
+        return None
+    width, height = rng.uniform(5, 120), rng.uniform(5, 60)
+    west = rng.uniform(-180, 180)
+    east = west + width if west + width <= 180 else west + width - 360
+    south = rng.uniform(-90, 90 - height)
+    return [round(west, 3), round(south, 3), round(east, 3), round(south + height, 3)]
+
+
+async def run(url: str, clients: int, max_points: int, bboxes: int) -> List[tuple]:
+    rng = random.Random(1)
+    pool = [random_bbox(rng) for _ in range(max(1, bboxes))]
+    results: list = []
+    tasks = []
+    for i in range(clients):
+        views = [
+            {"year": 2024, "gwp_years": 100, "max_points": max_points, "bbox": pool[i % len(pool)]},
+            {"year": 2024, "gwp_years": 20, "max_points": max_points, "bbox": pool[(i * 7 + 3) % len(pool)]},
+        ]
+        tasks.append(client(url, views, switch=i % 2 == 1, results=results))
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = [o for o in outcomes if isinstance(o, Exception)]
+    if failures:
+        print(f"{len(failures)} clients failed, e.g. {failures[0]!r}")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="WebSocket fan-out load test")
+    parser.add_argument("--url", help="ws:// URL of a running server (default: start one in-process)")
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--points", type=int, default=20_000, help="max_points per view (5000-100000)")
+    parser.add_argument("--bboxes", type=int, help="distinct bboxes shared by the clients (default: one per client)")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    url = args.url
+    if url is None:
+        use_synthetic_upstream(args.points)
+        start_server(args.port)
+        url = f"ws://127.0.0.1:{args.port}/api/climate/trace/ws"
+
+    t0 = time.perf_counter()
+    results = asyncio.run(run(url, args.clients, args.points, args.bboxes or args.clients))
+    elapsed = time.perf_counter() - t0
+    first = [r[0] for r in results if r[0] is not None]
+    done = [r[1] for r in results if r[1] is not None]
+    print(f"{len(results)}/{args.clients} clients completed in {elapsed:.1f}s")
+    if first:
+        print(f"first chunk  p50 {statistics.median(first):.2f}s  p95 {pct(first, 0.95):.2f}s")
+    if done:
+        print(f"complete     p50 {statistics.median(done):.2f}s  p95 {pct(done, 0.95):.2f}s")
+    health_url = url.replace("ws://", "http://").replace("wss://", "https://").replace("/api/climate/trace/ws", "/api/health")
+    try:
+        live = httpx.get(health_url, timeout=5).json().get("live")
+        # upstream_crawls should equal the number of distinct views; cached_bbox_messages stays <= BBOX_CACHE_MAX per feed
+        print(f"server live stats: {live}")
+    except Exception as e:
+        print(f"could not read {health_url}: {e}")
+
+
+if __name__ == "__main__":
+    main()
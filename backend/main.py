@@ -3,20 +3,36 @@ Climate Globe FastAPI Backend
 Provides RESTful API endpoints for climate data visualization
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
+import asyncio
 import json
+from contextlib import asynccontextmanager
 import os
 import uvicorn
 
 from models import (
     ClimateDataResponse, ThreatData, DefenseData, ClimateStats,
-    ThreatCategory, DefenseCategory
+    ThreatCategory, DefenseCategory, Intensity, TraceSort
 )
 from services import climate_service
-from climate_trace import get_trace_threats, get_climate_stats_placeholder, stream_trace_chunks
+from climate_trace import (
+    PAGE_SIZE, get_trace_columns, get_trace_threats, get_climate_stats_placeholder, stream_trace_chunks,
+    search_trace_threats, start_worker_pool, shutdown_worker_pool,
+)
+from trace_query import TraceQueryError, build_filters, query_threats
+from trace_broadcast import FeedLimitError, Subscriber, feed_max_points, parse_bbox, trace_broadcaster
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Own the Climate TRACE page-decoding process pool for the lifetime of this server process."""
+    start_worker_pool()
+    yield
+    shutdown_worker_pool()
 
 
 # Initialize FastAPI app
@@ -25,7 +41,8 @@ app = FastAPI(
     description="REST API for global greenhouse gas emissions data (Climate TRACE)",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
 # Configure CORS for frontend access (local + production URL from env)
@@ -37,6 +54,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Search-Truncated"],
 )
 
 
@@ -57,7 +75,8 @@ async def health_check():
         "status": "healthy",
         "data_loaded": True,
         "threat_count": len(climate_service.threat_data),
-        "defense_count": len(climate_service.defense_data)
+        "defense_count": len(climate_service.defense_data),
+        "live": trace_broadcaster.stats(),
     }
 
 
@@ -82,15 +101,44 @@ async def get_climate_trace(
     max_points: int = Query(16_500, ge=1_000, le=100_000, description="Emissions sources to fetch from Climate TRACE (2.7M+ available)"),
     year: Optional[int] = Query(2024, ge=2015, le=2024, description="Emissions year (2015-2024)"),
     gwp_years: int = Query(100, description="GWP horizon: 100 or 20 years for CO2e"),
+    decimate: bool = Query(False, description="Return a spatially balanced sample of max_points drawn from source_points"),
+    source_points: int = Query(100_000, ge=1_000, le=100_000, description="Sources to sample from when decimate=true"),
+    sector: Optional[List[str]] = Query(None, description="Only these sectors (repeatable, e.g. ?sector=power&sector=cement)"),
+    intensity: Optional[List[Intensity]] = Query(None, description="Only these intensities (repeatable)"),
+    min_value: Optional[float] = Query(None, description="Minimum emissions value (as returned in `value`)"),
+    max_value: Optional[float] = Query(None, description="Maximum emissions value (as returned in `value`)"),
+    label: Optional[str] = Query(None, max_length=200, description="Case-insensitive substring of the asset label"),
+    sort: TraceSort = Query(TraceSort.API, description="Sort order: api, value-desc, value-asc, label, sector"),
+    limit: Optional[int] = Query(None, ge=1, le=100_000, description="Page size; omit to return all matches"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous response's next_cursor"),
 ):
     """
     Get emissions data from Climate TRACE (millions of real sources).
     Data: https://climatetrace.org/data (CC BY 4.0). First call may take a minute; result is cached 1 hour.
+
+    Filters, sort and pagination are evaluated server-side over the cached sources;
+    follow `next_cursor` to page through `total_matching` results.
+
+    With `decimate=true`, `max_points` is a rendering budget: dense regions are thinned to their largest
+    emitters and the emissions of dropped sources are folded into the nearest kept ones.
     """
     if gwp_years not in (20, 100):
         gwp_years = 100
+
+    def fetch_page():
+        # Crawling, decimation and filtering block for up to seconds; keep them off the event loop,
+        # which also feeds every live WebSocket subscriber
+        filters = build_filters(
+            sectors=sector, intensities=intensity, min_value=min_value, max_value=max_value, label=label,
+        )
+        columns = get_trace_columns(
+            max_points=max_points, year=year, gwp_years=gwp_years,
+            decimate_from=source_points if decimate else None,
+        )
+        return query_threats(columns, filters, sort=sort, limit=limit, cursor=cursor)
+
     try:
-        threats = get_trace_threats(max_points=max_points, year=year, gwp_years=gwp_years)
+        threats, total_matching, next_cursor = await run_in_threadpool(fetch_page)
         stats = get_climate_stats_placeholder()
         return ClimateDataResponse(
             threats=threats,
@@ -98,26 +146,67 @@ async def get_climate_trace(
             stats=stats,
             total_threats=len(threats),
             total_defense=0,
+            total_matching=total_matching,
+            next_cursor=next_cursor,
         )
+    except TraceQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch Climate TRACE data: {str(e)}")
 
 
+@app.get("/api/climate/trace/search", response_model=List[ThreatData], tags=["Climate Data"])
+async def search_climate_trace(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Asset name or sector; each word matches as a prefix"),
+    limit: int = Query(20, ge=1, le=500, description="Maximum results"),
+    max_points: int = Query(16_500, ge=1_000, le=100_000, description="Which cached trace set to search"),
+    year: Optional[int] = Query(2024, ge=2015, le=2024, description="Emissions year (2015-2024)"),
+    gwp_years: int = Query(100, description="GWP horizon: 100 or 20 years for CO2e"),
+):
+    """
+    Find emissions sources by name or sector (e.g. ?q=belchat or ?q=steel poland).
+    Results are ranked by emissions value, highest first. If every word is very common (e.g. ?q=p 1),
+    the scan is time-bounded; `X-Search-Truncated: true` then means more matches may exist.
+    """
+    if gwp_years not in (20, 100):
+        gwp_years = 100
+    try:
+        results, truncated = await run_in_threadpool(
+            search_trace_threats, q, limit=limit, max_points=max_points, year=year, gwp_years=gwp_years,
+        )
+        response.headers["X-Search-Truncated"] = "true" if truncated else "false"
+        return results
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to search Climate TRACE data: {str(e)}")
+
+
 @app.get("/api/climate/trace/stream", tags=["Climate Data"])
 async def stream_climate_trace(
     max_points: int = Query(16_500, ge=5_000, le=100_000, description="Total sources to stream"),
     year: Optional[int] = Query(2024, ge=2015, le=2024, description="Emissions year"),
     gwp_years: int = Query(100, description="GWP horizon: 100 or 20 years"),
+    decimate: bool = Query(False, description="Stream a spatially balanced sample of max_points drawn from source_points"),
+    source_points: int = Query(100_000, ge=5_000, le=100_000, description="Sources to sample from when decimate=true"),
 ):
     """
     Stream emissions data from Climate TRACE in chunks so the globe can load progressively.
     Returns NDJSON: one JSON array of source objects per line.
+    With decimate=true the sample is computed from the full source set first, then streamed in chunks.
     """
     if gwp_years not in (20, 100):
         gwp_years = 100
 
+    def chunks():
+        if not decimate:
+            yield from stream_trace_chunks(max_points=max_points, year=year, gwp_years=gwp_years)
+            return
+        sample = get_trace_threats(max_points=max_points, year=year, gwp_years=gwp_years, decimate_from=source_points)
+        for i in range(0, len(sample), PAGE_SIZE):
+            yield sample[i:i + PAGE_SIZE]
+
     def gen():
-        for chunk in stream_trace_chunks(max_points=max_points, year=year, gwp_years=gwp_years):
+        for chunk in chunks():
             line = json.dumps([p.model_dump() for p in chunk], default=str) + "\n"
             yield line.encode("utf-8")
 
@@ -128,6 +217,66 @@ async def stream_climate_trace(
     )
 
 
+@app.websocket("/api/climate/trace/ws")
+async def trace_websocket(websocket: WebSocket):
+    """
+    Live Climate TRACE feed. Send {"action": "subscribe", "year": 2024, "gwp_years": 100,
+    "max_points": 16500, "bbox": [west, south, east, north]} (bbox optional) to receive a
+    "snapshot" message, "chunk" messages as data loads, "complete", then "diff" messages on refresh.
+    Subscribe again to switch views; {"action": "unsubscribe"} stops updates.
+    max_points is rounded up to a tier (5000, 16500, 50000, 100000; the snapshot reports the tier), and
+    all clients watching the same year/GWP/tier share one upstream crawl.
+    """
+    await websocket.accept()
+    sub = Subscriber()
+
+    async def pump():
+        while True:
+            message = await sub.next_message()
+            if message is None:
+                await websocket.close(code=1013)  # try again later: client fell behind
+                return
+            await websocket.send_text(message)
+
+    sender = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                msg = json.loads(await websocket.receive_text())
+                action = msg.get("action")
+            except (ValueError, AttributeError):
+                sub.send_json({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            if action == "subscribe":
+                try:
+                    year = msg.get("year", 2024)
+                    if year is not None and not 2015 <= int(year) <= 2024:
+                        raise ValueError("year must be between 2015 and 2024")
+                    gwp_years = 20 if msg.get("gwp_years") == 20 else 100
+                    max_points = int(msg.get("max_points", 16_500))
+                    if not 5_000 <= max_points <= 100_000:
+                        raise ValueError("max_points must be between 5000 and 100000")
+                    bbox = parse_bbox(msg.get("bbox"))
+                except (TypeError, ValueError) as e:
+                    sub.send_json({"type": "error", "detail": str(e)})
+                    continue
+                key = (int(year) if year is not None else None, gwp_years, feed_max_points(max_points))
+                try:
+                    trace_broadcaster.subscribe(sub, key, bbox)
+                except FeedLimitError as e:
+                    sub.send_json({"type": "error", "detail": str(e)})
+            elif action == "unsubscribe":
+                trace_broadcaster.unsubscribe(sub)
+                sub.clear()
+            else:
+                sub.send_json({"type": "error", "detail": f"Unknown action: {action}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        trace_broadcaster.unsubscribe(sub)
+        sender.cancel()
+
+
 @app.get("/api/climate/threats", response_model=List[ThreatData], tags=["Climate Data"])
 async def get_threats(
     category: Optional[ThreatCategory] = Query(
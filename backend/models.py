@@ -24,6 +24,14 @@ class Intensity(str, Enum):
     LOW = "low"
 
 
+class TraceSort(str, Enum):
+    API = "api"
+    VALUE_DESC = "value-desc"
+    VALUE_ASC = "value-asc"
+    LABEL = "label"
+    SECTOR = "sector"
+
+
 class ThreatData(BaseModel):
     lat: float = Field(..., description="Latitude coordinate")
     lng: float = Field(..., description="Longitude coordinate")
@@ -60,3 +68,5 @@ class ClimateDataResponse(BaseModel):
     stats: ClimateStats
     total_threats: int
     total_defense: int
+    total_matching: Optional[int] = Field(None, description="Threats matching the query filters (across all pages)")
+    next_cursor: Optional[str] = Field(None, description="Opaque cursor for the next page; null on the last page")
@@ -0,0 +1,326 @@
+"""
+Shared live feeds of Climate TRACE data for WebSocket clients.
+One upstream crawl per (year, gwp_years, max_points tier) view is fanned out to every subscriber;
+each subscriber filters by its own bbox. Background refreshes are pushed as diffs.
+The number of feeds is capped, and an initial crawl is cancelled once its last subscriber leaves.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from models import ThreatData
+from climate_trace import CACHE_TTL_SEC, PAGE_SIZE, stream_trace_chunks
+
+
+# Messages a subscriber may have queued before it is considered too slow and disconnected
+SUBSCRIBER_QUEUE_MAX = 512
+# Encoded bbox-filtered messages kept per feed (LRU); whole-globe chunks are always kept
+BBOX_CACHE_MAX = 256
+# Feed sizes: a requested max_points is rounded up to the next tier, so clients share crawls
+FEED_POINT_TIERS = (5_000, 16_500, 50_000, 100_000)
+# Live feeds (each with its own upstream crawl) kept at once; idle loaded feeds are evicted to make room
+FEEDS_MAX = 12
+
+BBox = Tuple[float, float, float, float]  # west, south, east, north (west > east crosses the antimeridian)
+FeedKey = Tuple[Optional[int], int, int]  # year, gwp_years, max_points
+
+
+def parse_bbox(raw) -> Optional[BBox]:
+    """[west, south, east, north] in degrees, or None for the whole globe. Raises ValueError."""
+    if raw is None:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in raw)
+    except (TypeError, ValueError):
+        raise ValueError("bbox must be [west, south, east, north]")
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        raise ValueError("bbox out of range")
+    return west, south, east, north
+
+
+class FeedLimitError(ValueError):
+    """Every feed slot is in use by a view with subscribers or a crawl in progress."""
+
+
+def feed_max_points(requested: int) -> int:
+    """Smallest FEED_POINT_TIERS entry covering `requested` (capped at the largest tier)."""
+    for tier in FEED_POINT_TIERS:
+        if requested <= tier:
+            return tier
+    return FEED_POINT_TIERS[-1]
+
+
+def in_bbox(t: ThreatData, bbox: Optional[BBox]) -> bool:
+    if bbox is None:
+        return True
+    west, south, east, north = bbox
+    if not south <= t.lat <= north:
+        return False
+    return west <= t.lng <= east if west <= east else (t.lng >= west or t.lng <= east)
+
+
+def _point_key(t: ThreatData) -> tuple:
+    return (t.label, round(t.lat, 5), round(t.lng, 5), t.sector)
+
+
+def _encode_points(points: List[ThreatData]) -> str:
+    return json.dumps([p.model_dump(mode="json") for p in points])
+
+
+class Subscriber:
+    """One WebSocket connection: an outgoing message queue plus its current view."""
+
+    def __init__(self):
+        self.feed: Optional["TraceFeed"] = None
+        self.bbox: Optional[BBox] = None
+        self.closed = False
+        self._messages: Deque[str] = deque()
+        self._ready = asyncio.Event()
+
+    def send(self, message: str) -> None:
+        if self.closed:
+            return
+        if len(self._messages) >= SUBSCRIBER_QUEUE_MAX:
+            # Too slow to keep up: drop the backlog and tell the client to reconnect
+            self._messages.clear()
+            self._messages.append(json.dumps({"type": "error", "detail": "Subscriber too slow; reconnect"}))
+            self.closed = True
+        else:
+            self._messages.append(message)
+        self._ready.set()
+
+    def send_json(self, payload: dict) -> None:
+        self.send(json.dumps(payload))
+
+    def clear(self) -> None:
+        self._messages.clear()
+
+    async def next_message(self) -> Optional[str]:
+        """Next queued message; None once the subscriber is closed and drained."""
+        while not self._messages:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        return self._messages.popleft()
+
+
+class TraceFeed:
+    """Progressively loaded, periodically refreshed data for one view, shared by all its subscribers."""
+
+    def __init__(self, key: FeedKey):
+        self.key = key
+        self.chunks: List[List[ThreatData]] = []
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self.crawls = 0
+        self.subscribers: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._globe_chunks: List[str] = []  # encoded whole-globe chunk messages, by seq
+        self._bbox_cache: "OrderedDict[tuple, str]" = OrderedDict()  # (seq or "complete", bbox) -> message
+
+    @property
+    def view(self) -> dict:
+        year, gwp_years, max_points = self.key
+        return {"year": year, "gwp_years": gwp_years, "max_points": max_points}
+
+    @property
+    def loading(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _bbox_cached(self, key: tuple, encode) -> str:
+        """Message for an arbitrary bbox, shared by subscribers with the same bbox while it stays in the LRU."""
+        msg = self._bbox_cache.get(key)
+        if msg is None:
+            msg = self._bbox_cache[key] = encode()
+            if len(self._bbox_cache) > BBOX_CACHE_MAX:
+                self._bbox_cache.popitem(last=False)
+        else:
+            self._bbox_cache.move_to_end(key)
+        return msg
+
+    def _encode_chunk(self, seq: int, points: List[ThreatData]) -> str:
+        return f'{{"type":"chunk","version":{self.version},"seq":{seq},"points":{_encode_points(points)}}}'
+
+    def _chunk_json(self, seq: int, bbox: Optional[BBox]) -> str:
+        """Chunk message for a bbox, encoded once and shared by all subscribers with that bbox."""
+        if bbox is None:
+            while len(self._globe_chunks) <= seq:
+                n = len(self._globe_chunks)
+                self._globe_chunks.append(self._encode_chunk(n, self.chunks[n]))
+            return self._globe_chunks[seq]
+        return self._bbox_cached(
+            (seq, bbox), lambda: self._encode_chunk(seq, [t for t in self.chunks[seq] if in_bbox(t, bbox)])
+        )
+
+    def _complete_json(self, bbox: Optional[BBox]) -> str:
+        def encode() -> str:
+            total = sum(1 for chunk in self.chunks for t in chunk if in_bbox(t, bbox))
+            return json.dumps({"type": "complete", "version": self.version, "total": total})
+
+        return self._bbox_cached(("complete", bbox), encode)
+
+    def add(self, sub: Subscriber) -> None:
+        """Attach a subscriber: replay what is loaded so far, then it receives live chunks."""
+        self.subscribers.add(sub)
+        sub.send_json({"type": "snapshot", "view": {**self.view, "bbox": sub.bbox}, "version": self.version,
+                       "loading": self.loaded_at is None})
+        for seq in range(len(self.chunks)):
+            sub.send(self._chunk_json(seq, sub.bbox))
+        if self.loaded_at is not None:
+            sub.send(self._complete_json(sub.bbox))
+        self.ensure_fresh()
+
+    def remove(self, sub: Subscriber) -> None:
+        self.subscribers.discard(sub)
+
+    def cancel(self) -> None:
+        """Stop an in-progress crawl or refresh (the page being fetched finishes in its thread)."""
+        if self.loading:
+            self._task.cancel()
+
+    def ensure_fresh(self) -> None:
+        """Start the initial crawl, or a refresh if the data is older than CACHE_TTL_SEC."""
+        if self.loading:
+            return
+        if self.loaded_at is None:
+            self._task = asyncio.get_running_loop().create_task(self._crawl())
+        elif time.time() - self.loaded_at >= CACHE_TTL_SEC and self.subscribers:
+            self._task = asyncio.get_running_loop().create_task(self._refresh())
+
+    async def _chunks_from_upstream(self):
+        """Async iterator over stream_trace_chunks, run in a thread so the event loop is never blocked."""
+        year, gwp_years, max_points = self.key
+        loop = asyncio.get_running_loop()
+        gen = stream_trace_chunks(max_points=max_points, year=year, gwp_years=gwp_years)
+        self.crawls += 1
+        while True:
+            chunk = await loop.run_in_executor(None, next, gen, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    async def _crawl(self) -> None:
+        """Initial load: push each chunk to every subscriber as it arrives."""
+        self._bbox_cache.clear()  # drop "complete" messages from an earlier empty crawl
+        async for chunk in self._chunks_from_upstream():
+            seq = len(self.chunks)
+            self.chunks.append(chunk)
+            for sub in list(self.subscribers):
+                sub.send(self._chunk_json(seq, sub.bbox))
+        # An empty crawl (upstream down) is retried by the next ensure_fresh()
+        self.loaded_at = time.time() if self.chunks else None
+        for sub in list(self.subscribers):
+            sub.send(self._complete_json(sub.bbox))
+
+    async def _refresh(self) -> None:
+        """Re-crawl in the background and push only what changed."""
+        fresh: List[ThreatData] = []
+        async for chunk in self._chunks_from_upstream():
+            fresh.extend(chunk)
+        self.loaded_at = time.time()
+        if not fresh:
+            return  # upstream unavailable; keep serving the old data
+        old = {_point_key(t): t for chunk in self.chunks for t in chunk}
+        new = {_point_key(t): t for t in fresh}
+        added = [t for k, t in new.items() if k not in old]
+        updated = [t for k, t in new.items() if k in old and old[k] != t]
+        removed = [t for k, t in old.items() if k not in new]
+        self.chunks = [fresh[i:i + PAGE_SIZE] for i in range(0, len(fresh), PAGE_SIZE)]
+        self._globe_chunks.clear()
+        self._bbox_cache.clear()
+        if not (added or updated or removed):
+            return
+        self.version += 1
+        encoded: Dict[Optional[BBox], str] = {}
+        for sub in list(self.subscribers):
+            msg = encoded.get(sub.bbox)
+            if msg is None:
+                msg = encoded[sub.bbox] = (
+                    f'{{"type":"diff","version":{self.version},'
+                    f'"added":{_encode_points([t for t in added if in_bbox(t, sub.bbox)])},'
+                    f'"updated":{_encode_points([t for t in updated if in_bbox(t, sub.bbox)])},'
+                    f'"removed":{_encode_points([t for t in removed if in_bbox(t, sub.bbox)])}}}'
+                )
+            sub.send(msg)
+
+
+class TraceBroadcaster:
+    """Registry of live feeds; subscribers switch between feeds without reconnecting."""
+
+    def __init__(self, refresh_check_sec: float = 60.0):
+        self.feeds: Dict[FeedKey, TraceFeed] = {}
+        self.refresh_check_sec = refresh_check_sec
+        self._watcher: Optional[asyncio.Task] = None
+        self._dropped_crawls = 0
+
+    def subscribe(self, sub: Subscriber, key: FeedKey, bbox: Optional[BBox]) -> None:
+        """
+        Move sub to the feed for key (creating it if needed); anything queued for the old view is dropped.
+        Raises FeedLimitError (leaving sub unsubscribed) if a new feed is needed and none can be evicted.
+        """
+        same_feed = sub.feed is not None and sub.feed.key == key
+        if same_feed:
+            sub.feed.remove(sub)  # bbox change only: keep the feed and its crawl
+        else:
+            self.unsubscribe(sub)
+        sub.clear()
+        sub.bbox = bbox
+        feed = self.feeds.get(key)
+        if feed is None:
+            self._make_room()
+            feed = self.feeds[key] = TraceFeed(key)
+        sub.feed = feed
+        feed.add(sub)
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.get_running_loop().create_task(self._watch())
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        feed = sub.feed
+        if feed is not None:
+            feed.remove(sub)
+            sub.feed = None
+            if not feed.subscribers and feed.loaded_at is None:
+                # Nobody is waiting for this initial load any more: stop crawling upstream
+                self._drop(feed)
+
+    def _drop(self, feed: TraceFeed) -> None:
+        feed.cancel()
+        if self.feeds.get(feed.key) is feed:
+            del self.feeds[feed.key]
+            self._dropped_crawls += feed.crawls
+
+    def _make_room(self) -> None:
+        """Evict idle feeds (no subscribers, not loading), least recently loaded first, until a slot is free."""
+        if len(self.feeds) < FEEDS_MAX:
+            return
+        idle = [f for f in self.feeds.values() if not f.subscribers and not f.loading]
+        for feed in sorted(idle, key=lambda f: f.loaded_at or 0.0)[: len(self.feeds) - FEEDS_MAX + 1]:
+            self._drop(feed)
+        if len(self.feeds) >= FEEDS_MAX:
+            raise FeedLimitError("Too many live views are active; try again later or use a common view")
+
+    async def _watch(self) -> None:
+        """Refresh feeds that have subscribers; forget idle feeds whose data has expired."""
+        while self.feeds:
+            await asyncio.sleep(self.refresh_check_sec)
+            now = time.time()
+            for feed in list(self.feeds.values()):
+                if feed.subscribers:
+                    feed.ensure_fresh()
+                elif feed.loaded_at is None or now - feed.loaded_at >= CACHE_TTL_SEC:
+                    self._drop(feed)
+
+    def stats(self) -> dict:
+        return {
+            "feeds": len(self.feeds),
+            "subscribers": sum(len(f.subscribers) for f in self.feeds.values()),
+            "upstream_crawls": self._dropped_crawls + sum(f.crawls for f in self.feeds.values()),
+            "cached_bbox_messages": sum(len(f._bbox_cache) for f in self.feeds.values()),
+        }
+
+
+# Singleton instance
+trace_broadcaster = TraceBroadcaster()
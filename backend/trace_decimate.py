@@ -0,0 +1,155 @@
+"""
+Adaptive spatial decimation of emissions sources.
+Reduces a large set to a point budget that is spatially balanced (sparse regions keep every source,
+dense regions are capped) and value-preserving (emissions of dropped sources are folded into the
+nearest kept source in the same cell, so totals per cell are unchanged).
+"""
+
+import heapq
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from models import ThreatData
+
+
+# Target average kept points per occupied cell; sets the grid resolution
+POINTS_PER_CELL = 8
+
+
+def _cell_size(budget: int) -> float:
+    """Grid cell size in degrees so that the globe has roughly budget / POINTS_PER_CELL cells."""
+    cells = max(1, budget // POINTS_PER_CELL)
+    return max(0.05, math.sqrt(360.0 * 180.0 / cells))
+
+
+def _cell_quota(counts: Sequence[int], budget: int) -> int:
+    """Largest per-cell cap q with sum(min(count, q)) <= budget (water-filling)."""
+    lo, hi = 1, max(counts)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if sum(min(c, mid) for c in counts) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _nearest_finder(kept: List[int], lats: Sequence[float], lngs: Sequence[float]) -> Callable[[float, float], int]:
+    """
+    Nearest kept source for points in the same cell. Kept sources are bucketed on a sub-grid of about
+    one source per bucket, and the search widens ring by ring until the nearest is certain.
+    """
+    # Distances within a cell are small, so scale longitude by the cell's mean latitude
+    cos_lat = math.cos(math.radians(sum(lats[j] for j in kept) / len(kept)))
+    pts = [(j, lats[j], lngs[j] * cos_lat) for j in kept]
+
+    def scan(lat: float, x: float) -> int:
+        return min(pts, key=lambda p: (p[1] - lat) ** 2 + (p[2] - x) ** 2)[0]
+
+    if len(pts) <= 24:
+        return lambda lat, lng: scan(lat, lng * cos_lat)
+
+    min_y, max_y = min(p[1] for p in pts), max(p[1] for p in pts)
+    min_x, max_x = min(p[2] for p in pts), max(p[2] for p in pts)
+    step = max(max_y - min_y, max_x - min_x, 1e-9) / math.sqrt(len(pts))
+    buckets: Dict[Tuple[int, int], list] = {}
+    for p in pts:
+        buckets.setdefault((int((p[1] - min_y) // step), int((p[2] - min_x) // step)), []).append(p)
+    max_ring = int(max(max_y - min_y, max_x - min_x) // step) + 2
+
+    def nearest(lat: float, lng: float) -> int:
+        x = lng * cos_lat
+        if not (min_y <= lat <= max_y and min_x <= x <= max_x):
+            return scan(lat, x)  # outside the kept sources' extent the ring bound does not hold
+        cy, cx = int((lat - min_y) // step), int((x - min_x) // step)
+        best, best_d = pts[0][0], float("inf")
+        for ring in range(max_ring + 1):
+            # Anything in a farther ring is at least (ring - 1) * step away
+            if ring > 0 and ((ring - 1) * step) ** 2 > best_d:
+                break
+            for by in range(cy - ring, cy + ring + 1):
+                for bx in range(cx - ring, cx + ring + 1):
+                    if ring and by not in (cy - ring, cy + ring) and bx not in (cx - ring, cx + ring):
+                        continue
+                    for j, py, px in buckets.get((by, bx), ()):
+                        d = (py - lat) ** 2 + (px - x) ** 2
+                        if d < best_d:
+                            best, best_d = j, d
+        return best
+
+    return nearest
+
+
+def decimate_threats(
+    threats: Sequence[ThreatData],
+    budget: int,
+    intensity_for: Optional[Callable[[float], object]] = None,
+    describe: Optional[Callable[[ThreatData, float, int], str]] = None,
+) -> List[ThreatData]:
+    """
+    Return at most `budget` sources chosen cell by cell: each cell keeps its largest emitters up to a shared
+    cap, and every dropped source's value is added to the nearest kept source in its cell.
+    intensity_for(value) recomputes intensity for sources that absorbed residual mass, and
+    describe(source, new_value, absorbed_sources) rebuilds their description from the new total.
+    Output keeps the input (API) order of the kept sources.
+    """
+    if budget <= 0:
+        return []
+    if len(threats) <= budget:
+        return list(threats)
+
+    lats = [t.lat for t in threats]
+    lngs = [t.lng for t in threats]
+    values = [t.value for t in threats]
+    size = _cell_size(budget)
+    cells: Dict[Tuple[int, int], List[int]] = {}
+    for i in range(len(threats)):
+        key = (int((lats[i] + 90.0) // size), int((lngs[i] + 180.0) // size))
+        cells.setdefault(key, []).append(i)
+
+    def mass(m: List[int]) -> float:
+        return sum(values[i] for i in m)
+
+    members = list(cells.values())
+    if len(members) > budget:
+        # Budget below one point per occupied cell: keep the heaviest cells
+        members = heapq.nlargest(budget, members, key=mass)
+    quota = _cell_quota([len(m) for m in members], budget)
+    # Hand leftover budget (below the next cap step) to the heaviest capped cells
+    spare = budget - sum(min(len(m), quota) for m in members)
+    capped = [m for m in members if len(m) > quota]
+    extra = {id(m) for m in heapq.nlargest(spare, capped, key=mass)} if spare else set()
+
+    folded: Dict[int, Tuple[float, int]] = {}  # kept index -> (added value, absorbed sources)
+    kept: List[int] = []
+    for m in members:
+        k = quota + (1 if id(m) in extra else 0)
+        if len(m) <= k:
+            kept.extend(m)
+            continue
+        top = heapq.nlargest(k, m, key=values.__getitem__)
+        kept.extend(top)
+        top_set = set(top)
+        nearest = _nearest_finder(top, lats, lngs)
+        for i in m:
+            if i not in top_set:
+                best = nearest(lats[i], lngs[i])
+                v, n = folded.get(best, (0.0, 0))
+                folded[best] = (v + values[i], n + 1)
+
+    kept.sort()
+    out: List[ThreatData] = []
+    for i in kept:
+        t = threats[i]
+        if i in folded:
+            extra_value, n = folded[i]
+            value = t.value + extra_value
+            if describe is not None:
+                description = describe(t, value, n)
+            else:
+                description = f"{t.description} (+{extra_value:,.4g} from {n} nearby source{'s' if n != 1 else ''})"
+            update = {"value": value, "description": description}
+            if intensity_for is not None:
+                update["intensity"] = intensity_for(value)
+            t = t.model_copy(update=update)
+        out.append(t)
+    return out
@@ -0,0 +1,216 @@
+"""
+Server-side filtering, sorting and cursor pagination for Climate TRACE results.
+Filters run column-wise over the cached snapshot as compact byte masks (one byte per row).
+Discrete filters (sector, intensity) are memoized per snapshot; value ranges use bisect over one value order.
+"""
+
+import base64
+import bisect
+import hashlib
+import itertools
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+from models import ThreatData, Intensity, TraceSort
+
+
+# Memoized sector/intensity masks per snapshot (LRU; ~1 byte per row each)
+MASK_MEMO_MAX = 32
+# Memoized ordered query results per snapshot (LRU; 4 bytes per matching row each), so cursor pages are cheap
+RESULT_MEMO_MAX = 8
+
+
+class TraceQueryError(ValueError):
+    """Invalid filter value or cursor supplied by the client."""
+
+
+def normalize_sector(sector: Optional[str]) -> str:
+    """Sector key used for matching: 'Oil-and-Gas_Production' -> 'oil and gas production'."""
+    return (sector or "other").strip().lower().replace("-", " ").replace("_", " ")
+
+
+class _LRU(OrderedDict):
+    """Small least-recently-used memo, safe to share between request threads."""
+
+    def __init__(self, max_entries: int):
+        super().__init__()
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self:
+                self.move_to_end(key)
+                return self[key]
+        value = compute()
+        with self._lock:
+            value = self.setdefault(key, value)
+            self.move_to_end(key)
+            if len(self) > self.max_entries:
+                self.popitem(last=False)
+        return value
+
+
+def _and_masks(masks: Sequence[bytes]) -> bytes:
+    """Row-wise AND of 0/1 byte masks, done on whole-mask integers."""
+    n = len(masks[0])
+    acc = int.from_bytes(masks[0], "little")
+    for m in masks[1:]:
+        acc &= int.from_bytes(m, "little")
+    return acc.to_bytes(n, "little")
+
+
+class TraceColumns:
+    """Column view over a list of ThreatData with memoized discrete filter masks and sort orders."""
+
+    def __init__(self, threats: List[ThreatData], snapshot_id: str):
+        self.threats = threats
+        self.snapshot_id = snapshot_id
+        self.values = [t.value for t in threats]
+        self.sectors = [normalize_sector(t.sector) for t in threats]
+        self.intensities = [t.intensity for t in threats]
+        self.labels = [t.label.casefold() for t in threats]
+        self._masks = _LRU(MASK_MEMO_MAX)
+        self._orders: dict = {}  # TraceSort -> array of row indices (at most one per sort option)
+        self._results = _LRU(RESULT_MEMO_MAX)
+        self._sorted_values: Optional[List[float]] = None
+
+    def __len__(self) -> int:
+        return len(self.threats)
+
+    def _in_mask(self, column: list, accepted: frozenset) -> bytes:
+        return bytes(1 if x in accepted else 0 for x in column)
+
+    def _value_range_mask(self, lo: Optional[float], hi: Optional[float]) -> bytes:
+        """Rows with lo <= value <= hi, found by bisect over the snapshot's ascending value order."""
+        order = self._order(TraceSort.VALUE_ASC)
+        if self._sorted_values is None:
+            self._sorted_values = [self.values[i] for i in order]
+        start = 0 if lo is None else bisect.bisect_left(self._sorted_values, lo)
+        stop = len(order) if hi is None else bisect.bisect_right(self._sorted_values, hi)
+        mask = bytearray(len(order))
+        for i in order[start:stop]:
+            mask[i] = 1
+        return bytes(mask)
+
+    def _mask(self, key: tuple) -> bytes:
+        """0/1 byte per row for one filter, e.g. ("sector", frozenset({"power"})) or ("label", "belchat")."""
+        kind, arg = key
+        if kind == "sector":
+            return self._masks.get_or_compute(key, lambda: self._in_mask(self.sectors, arg))
+        if kind == "intensity":
+            return self._masks.get_or_compute(key, lambda: self._in_mask(self.intensities, arg))
+        if kind == "value_range":
+            return self._value_range_mask(*arg)
+        if kind == "label":
+            return bytes(1 if arg in s else 0 for s in self.labels)
+        raise ValueError(f"Unknown filter: {kind}")
+
+    def _order(self, sort: TraceSort) -> array:
+        """Row indices in the requested sort order (stable; ties keep API order)."""
+        order = self._orders.get(sort)
+        if order is None:
+            idx = range(len(self.threats))
+            if sort == TraceSort.VALUE_DESC:
+                idx = sorted(idx, key=lambda i: -self.values[i])
+            elif sort == TraceSort.VALUE_ASC:
+                idx = sorted(idx, key=self.values.__getitem__)
+            elif sort == TraceSort.LABEL:
+                idx = sorted(idx, key=self.labels.__getitem__)
+            elif sort == TraceSort.SECTOR:
+                idx = sorted(idx, key=lambda i: (self.sectors[i], -self.values[i]))
+            order = self._orders[sort] = array("I", idx)
+        return order
+
+    def select(self, filters: Tuple[tuple, ...], sort: TraceSort) -> array:
+        """Ordered indices of rows matching every filter; the last few queries are memoized."""
+
+        def compute() -> array:
+            order = self._order(sort)
+            if not filters:
+                return order
+            mask = _and_masks([self._mask(f) for f in filters])
+            return array("I", itertools.compress(order, map(mask.__getitem__, order)))
+
+        return self._results.get_or_compute((filters, sort), compute)
+
+
+def build_filters(
+    sectors: Optional[Sequence[str]] = None,
+    intensities: Optional[Sequence[Intensity]] = None,
+    min_value: Optional[float] = None,
+    max_value: Optional[float] = None,
+    label: Optional[str] = None,
+) -> Tuple[tuple, ...]:
+    """
+    Normalize query parameters into a canonical, hashable filter tuple (order-independent).
+    Raises TraceQueryError for NaN or infinite value bounds.
+    """
+    for name, bound in (("min_value", min_value), ("max_value", max_value)):
+        if bound is not None and not math.isfinite(bound):
+            raise TraceQueryError(f"{name} must be a finite number")
+    filters: List[tuple] = []
+    if sectors:
+        filters.append(("sector", frozenset(normalize_sector(s) for s in sectors)))
+    if intensities:
+        filters.append(("intensity", frozenset(Intensity(i) for i in intensities)))
+    if min_value is not None or max_value is not None:
+        filters.append((
+            "value_range",
+            (None if min_value is None else float(min_value), None if max_value is None else float(max_value)),
+        ))
+    if label and label.strip():
+        filters.append(("label", label.strip().casefold()))
+    return tuple(sorted(filters, key=lambda f: f[0]))
+
+
+def _fingerprint(filters: Tuple[tuple, ...], sort: TraceSort) -> str:
+    canon = repr([(k, sorted(map(str, v)) if isinstance(v, frozenset) else v) for k, v in filters])
+    return hashlib.sha1(f"{canon}|{sort.value}".encode("utf-8")).hexdigest()[:12]
+
+
+def encode_cursor(snapshot_id: str, offset: int, fingerprint: str) -> str:
+    raw = f"{snapshot_id}:{offset}:{fingerprint}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int, str]:
+    """Inverse of encode_cursor. Raises TraceQueryError on malformed input."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        snapshot_id, offset, fingerprint = base64.urlsafe_b64decode(padded).decode("ascii").split(":")
+        return snapshot_id, int(offset), fingerprint
+    except Exception:
+        raise TraceQueryError("Malformed cursor")
+
+
+def query_threats(
+    columns: TraceColumns,
+    filters: Tuple[tuple, ...] = (),
+    sort: TraceSort = TraceSort.API,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> Tuple[List[ThreatData], int, Optional[str]]:
+    """
+    Filter, sort and page a cached snapshot.
+    Returns (page, total_matching, next_cursor). next_cursor is None on the last page or when limit is None.
+    Raises TraceQueryError if the cursor is malformed, was issued for a different query, or its snapshot has expired.
+    """
+    fingerprint = _fingerprint(filters, sort)
+    offset = 0
+    if cursor:
+        snapshot_id, offset, cursor_fp = decode_cursor(cursor)
+        if cursor_fp != fingerprint:
+            raise TraceQueryError("Cursor does not match the query parameters")
+        if snapshot_id != columns.snapshot_id:
+            raise TraceQueryError("Cursor has expired (data was refreshed); restart without a cursor")
+        if offset < 0:
+            raise TraceQueryError("Malformed cursor")
+
+    matched = columns.select(filters, sort)
+    end = len(matched) if limit is None else min(len(matched), offset + limit)
+    page = [columns.threats[i] for i in matched[offset:end]]
+    next_cursor = encode_cursor(columns.snapshot_id, end, fingerprint) if end < len(matched) else None
+    return page, len(matched), next_cursor
@@ -0,0 +1,186 @@
+"""
+In-memory search over Climate TRACE asset labels and sectors.
+Token inverted index with prefix lookup over a sorted vocabulary; results ranked by emissions value.
+Built incrementally: call add() with each page of ThreatData as it arrives.
+"""
+
+import bisect
+import heapq
+import itertools
+import operator
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from models import ThreatData
+
+
+_TOKEN_RE = re.compile(r"\w+")
+# Terms matching at most this many assets are materialized as posting sets and intersected;
+# broader terms are checked against each candidate's token text instead
+MATERIALIZE_MAX = 10_000
+# When every query term is broad, the largest emitters are scanned in value order: always at least
+# SCAN_MAX eligible assets, then further blocks until SCAN_TIME_BUDGET_SEC has passed since the search began
+SCAN_MAX = 20_000
+SCAN_TIME_BUDGET_SEC = 0.004
+SCAN_BLOCK = 2_048
+
+
+def normalize_text(text: str) -> str:
+    """Casefold and strip accents: 'Usina Térmica' -> 'usina termica'."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _TOKEN_RE.findall(normalize_text(text or "").replace("_", " "))
+
+
+class TraceSearchIndex:
+    """
+    Prefix search over labels + sectors. Every query term must prefix-match some token of the asset;
+    matches are returned highest emissions value first.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # a crawl thread adds pages while request threads search
+        self.threats: List[ThreatData] = []
+        self._values: List[float] = []
+        self._doc_text: List[str] = []  # " tok1 tok2 ...": term prefix-matches a token iff " " + term is a substring
+        self._postings: Dict[str, List[int]] = {}
+        self._vocab: List[str] = []
+        self._vocab_dirty = False
+        self._by_value: List[Tuple[float, int]] = []
+        self._ranked_text: List[str] = []  # _doc_text in _by_value order, for the broad-term scan
+        self._ranked_docs: List[int] = []  # doc ids in _by_value order
+        self._order_dirty = False
+        self._ranked_dirty = False
+
+    def __len__(self) -> int:
+        return len(self.threats)
+
+    def add(self, threats: Sequence[ThreatData]) -> None:
+        """Index a page of threats. Sorting is deferred to the next search."""
+        with self._lock:
+            self._add(threats)
+
+    def _add(self, threats: Sequence[ThreatData]) -> None:
+        for t in threats:
+            doc = len(self.threats)
+            tokens = tuple(dict.fromkeys(tokenize(t.label) + tokenize(t.sector)))
+            self.threats.append(t)
+            self._values.append(t.value)
+            self._doc_text.append("".join(" " + tok for tok in tokens))
+            self._by_value.append((-t.value, doc))
+            for tok in tokens:
+                posting = self._postings.get(tok)
+                if posting is None:
+                    self._postings[tok] = [doc]
+                    self._vocab.append(tok)
+                    self._vocab_dirty = True
+                else:
+                    posting.append(doc)
+        if threats:
+            self._order_dirty = self._ranked_dirty = True
+
+    def _refresh(self) -> None:
+        # Timsort merges the already-sorted prefix with the appended run in near-linear time
+        if self._vocab_dirty:
+            self._vocab.sort()
+            self._vocab_dirty = False
+        if self._order_dirty:
+            self._by_value.sort()
+            self._order_dirty = False
+
+    def _ranked(self) -> Tuple[List[str], List[int]]:
+        """Token text and doc id of every asset, largest emitter first (rebuilt only after new pages arrive)."""
+        if self._ranked_dirty:
+            self._ranked_docs = [doc for _, doc in self._by_value]
+            self._ranked_text = [self._doc_text[doc] for doc in self._ranked_docs]
+            self._ranked_dirty = False
+        return self._ranked_text, self._ranked_docs
+
+    def _prefix_range(self, term: str) -> Tuple[int, int]:
+        lo = bisect.bisect_left(self._vocab, term)
+        return lo, bisect.bisect_left(self._vocab, term + "\U0010ffff", lo)
+
+    def _term_count(self, lo: int, hi: int) -> int:
+        """Postings matched by a vocab range, or just its token count once that is already broad."""
+        if hi - lo > MATERIALIZE_MAX:
+            return hi - lo  # every token has at least one posting
+        return sum(map(len, map(self._postings.__getitem__, self._vocab[lo:hi])))
+
+    def search(self, query: str, limit: int = 20, within: Optional[int] = None) -> Tuple[List[ThreatData], bool]:
+        """
+        Top `limit` assets whose label/sector tokens prefix-match every query term, by value desc,
+        and whether the result may be incomplete.
+        within: only consider the first `within` assets added (a smaller max_points served from a larger crawl).
+        If at least one term is narrow the result is exact. When every term is broad (e.g. "p 1 2") the scan
+        is time-bounded (see SCAN_MAX); if it stops before the end with fewer than `limit` hits, the hits
+        found are still the top matches but more may exist, and truncated is True.
+        """
+        with self._lock:
+            return self._search(query, limit, within)
+
+    def _search(self, query: str, limit: int, within: Optional[int]) -> Tuple[List[ThreatData], bool]:
+        started = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return [], False
+        self._refresh()
+
+        narrow: List[Tuple[int, int, int]] = []
+        broad: List[Tuple[int, str]] = []
+        for term in terms:
+            lo, hi = self._prefix_range(term)
+            if lo == hi:
+                return [], False
+            count = self._term_count(lo, hi)
+            if count <= MATERIALIZE_MAX:
+                narrow.append((count, lo, hi))
+            else:
+                broad.append((count, " " + term))
+        needles = [needle for _, needle in sorted(broad)]  # rarest first
+
+        if narrow:
+            # Intersect posting sets rarest first; the running set only shrinks
+            candidates: Optional[set] = None
+            for _, lo, hi in sorted(narrow):
+                term_docs = set()
+                for tok in self._vocab[lo:hi]:
+                    term_docs.update(self._postings[tok])
+                candidates = term_docs if candidates is None else candidates & term_docs
+                if not candidates:
+                    return [], False
+            docs: List[int] = list(candidates if within is None else filter(within.__gt__, candidates))
+            for needle in needles:
+                docs = list(itertools.compress(docs, map(operator.contains, map(self._doc_text.__getitem__, docs),
+                                                         itertools.repeat(needle))))
+            best = heapq.nlargest(limit, docs, key=self._values.__getitem__)
+            return [self.threats[d] for d in best], False
+
+        # Every term is broad: scan the largest emitters block by block in value order, stopping once
+        # `limit` matches are found (nothing later can outrank them) or the scan budget is spent
+        ranked, ranked_docs = self._ranked()
+        found: List[int] = []
+        eligible = 0  # assets scanned that are within the first `within`
+        start = 0
+        while start < len(ranked) and len(found) < limit:
+            if eligible >= SCAN_MAX and time.perf_counter() - started >= SCAN_TIME_BUDGET_SEC:
+                break
+            stop = min(start + SCAN_BLOCK, len(ranked))
+            positions: Iterable[int] = range(start, stop)
+            texts: Iterable[str] = ranked[start:stop]
+            for needle in needles:
+                positions = list(itertools.compress(positions, map(operator.contains, texts, itertools.repeat(needle))))
+                texts = map(ranked.__getitem__, positions)
+            if within is None:
+                eligible += stop - start
+            else:
+                eligible += sum(map(within.__gt__, ranked_docs[start:stop]))
+                positions = [pos for pos in positions if ranked_docs[pos] < within]
+            found.extend(positions)
+            start = stop
+        truncated = len(found) < limit and start < len(ranked)
+        return [self.threats[ranked_docs[pos]] for pos in found[:limit]], truncated